@@ -1,115 +1,195 @@
-
 #!/usr/bin/env python3
 """
 Cursor IDE Integration
 HTTP-Server für Cursor AI Provider Integration
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import json
-import threading
+from contextlib import asynccontextmanager
+import itertools
+import time
+import orjson
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.middleware.cors import CORSMiddleware
 from smart_router import SmartAIRouter
 
-class CursorAIHandler(BaseHTTPRequestHandler):
-    
-    def __init__(self, *args, **kwargs):
-        self.router = SmartAIRouter()
-        super().__init__(*args, **kwargs)
-    
-    def do_POST(self):
-        """Handle Cursor AI requests"""
-        if self.path == "/v1/chat/completions":
-            self.handle_chat_completion()
-        else:
-            self.send_error(404, "Not Found")
-    
-    def handle_chat_completion(self):
-        """OpenAI-compatible chat completion endpoint"""
+# Eine Router-Instanz für alle Requests (nicht pro Request neu erzeugen)
+router = SmartAIRouter()
+
+# Fortlaufende Completion-IDs (eindeutig pro Server-Lauf)
+_completion_ids = itertools.count(1)
+
+def _completion_id() -> str:
+    """Neue Completion-ID im OpenAI-Stil"""
+    return f"chatcmpl-router-{next(_completion_ids)}"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Schließt die HTTP-Clients des Routers beim Herunterfahren"""
+    yield
+    await router.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# CORS für Browser-basierte Clients (ersetzt do_OPTIONS)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"]
+)
+
+@app.post("/v1/chat/completions")
+async def handle_chat_completion(request: Request):
+    """OpenAI-compatible chat completion endpoint"""
+    try:
+        request_data = orjson.loads(await request.body())
+
+        # Extract prompt from messages
+        messages = request_data.get('messages', [])
+        if not messages:
+            raise ValueError("No messages provided")
+
+        # Combine messages into single prompt (ein dict.get pro Message)
+        parts = []
+        append = parts.append
+        for msg in messages:
+            content = msg.get('content')
+            if content:
+                append(content)
+        prompt = "\n".join(parts)
+
+        if request_data.get('stream'):
+            return await stream_chat_completion(prompt)
+
+        # Route request
+        result = await router.route_request_async(prompt)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server Error: {str(e)}")
+
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=f"AI Router Error: {result['error']}")
+
+    # Format as OpenAI-compatible response (direkt per orjson, ohne jsonable_encoder)
+    return Response(orjson.dumps({
+        "id": _completion_id(),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": result["model"],
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": result["response"]
+            },
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(result),
+        "router_info": _router_info(result)
+    }), media_type="application/json")
+
+def _usage(result: dict) -> dict:
+    """OpenAI-kompatible Usage-Angaben"""
+    tokens = result["tokens"]
+    tok_in = tokens["input"]
+    tok_out = tokens["output"]
+    return {
+        "prompt_tokens": tok_in,
+        "completion_tokens": tok_out,
+        "total_tokens": tok_in + tok_out
+    }
+
+def _router_info(result: dict) -> dict:
+    """Router-spezifische Zusatzinfos (Kosten, Budget, Routing-Grund)"""
+    budget_status = result["budget_status"]
+    return {
+        "cost": result["cost"],
+        "budget_remaining": budget_status["remaining"],
+        "routing_reason": result["routing_reason"]
+    }
+
+def _sse_event(data) -> bytes:
+    """Kodiert ein Server-Sent-Event"""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+def _completion_chunk(completion_id: str, created: int, model: str, delta: dict,
+                      finish_reason=None) -> dict:
+    """OpenAI-kompatibler chat.completion.chunk"""
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": delta,
+            "finish_reason": finish_reason
+        }]
+    }
+
+async def stream_chat_completion(prompt: str) -> StreamingResponse:
+    """Streamt die Antwort als OpenAI-kompatible SSE-Chunks"""
+    chunks = router.route_request_stream_async(prompt)
+
+    # Ersten Chunk vorab holen, damit Fehler noch als HTTP 500 gemeldet werden können
+    first = await anext(chunks)
+    if first["done"] and not first["result"]["success"]:
+        await chunks.aclose()
+        raise HTTPException(status_code=500, detail=f"AI Router Error: {first['result']['error']}")
+
+    completion_id = _completion_id()
+    created = int(time.time())
+
+    async def events():
+        # Bei Client-Disconnect den Router-Stream sofort schließen (Kosten verbuchen, Slot freigeben)
         try:
-            # Read request body
-            content_length = int(self.headers['Content-Length'])
-            body = self.rfile.read(content_length)
-            request_data = json.loads(body.decode('utf-8'))
-            
-            # Extract prompt from messages
-            messages = request_data.get('messages', [])
-            if not messages:
-                raise ValueError("No messages provided")
-            
-            # Combine messages into single prompt
-            prompt = "\n".join([msg.get('content', '') for msg in messages if msg.get('content')])
-            
-            # Route request
-            result = self.router.route_request(prompt)
-            
-            if result["success"]:
-                # Format as OpenAI-compatible response
-                response_data = {
-                    "id": "cursor-ai-router",
-                    "object": "chat.completion",
-                    "created": int(__import__('time').time()),
-                    "model": result["model"],
-                    "choices": [{
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": result["response"]
-                        },
-                        "finish_reason": "stop"
-                    }],
-                    "usage": {
-                        "prompt_tokens": result["tokens"]["input"],
-                        "completion_tokens": result["tokens"]["output"],
-                        "total_tokens": result["tokens"]["input"] + result["tokens"]["output"]
-                    },
-                    "router_info": {
-                        "cost": result["cost"],
-                        "budget_remaining": result["budget_status"]["remaining"],
-                        "routing_reason": result["routing_reason"]
-                    }
-                }
-                
-                # Send response
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                
-            else:
-                self.send_error(500, f"AI Router Error: {result['error']}")
-                
-        except Exception as e:
-            self.send_error(500, f"Server Error: {str(e)}")
-    
-    def do_OPTIONS(self):
-        """Handle CORS preflight requests"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        self.end_headers()
-    
-    def log_message(self, format, *args):
-        """Override to reduce log noise"""
-        return
+            item = first
+            delta = {"role": "assistant"}
+            while not item["done"]:
+                delta["content"] = item["response"]
+                yield _sse_event(_completion_chunk(completion_id, created, item["model"], delta))
+                delta = {}
+                item = await anext(chunks)
+
+            result = item["result"]
+            if not result["success"]:
+                # Status ist bereits gesendet - Fehler als Event melden
+                yield _sse_event({"error": {"message": f"AI Router Error: {result['error']}"}})
+                return
+
+            # Nicht gestreamte Ergebnisse (Claude, Cache-Hit) als ein Chunk senden
+            if "role" in delta:
+                delta["content"] = result["response"]
+                yield _sse_event(_completion_chunk(completion_id, created, result["model"], delta))
+
+            final = _completion_chunk(completion_id, created, result["model"], {}, "stop")
+            final["usage"] = _usage(result)
+            final["router_info"] = _router_info(result)
+            yield _sse_event(final)
+            yield b"data: [DONE]\n\n"
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 def start_server(port=8000):
     """Start HTTP server for Cursor integration"""
-    server = HTTPServer(('localhost', port), CursorAIHandler)
     print(f"🚀 Cursor AI Router Server läuft auf http://localhost:{port}")
     print(f"📋 Cursor AI Provider URL: http://localhost:{port}/v1/chat/completions")
     print(f"🤖 Model Name: intelligent-router")
     print("🛑 Stoppen mit Ctrl+C")
-    
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("\n⏹️  Server gestoppt")
-        server.shutdown()
+
+    # access_log aus, um Log-Noise zu reduzieren
+    uvicorn.run(app, host="localhost", port=port, loop="uvloop",
+                log_level="warning", access_log=False)
+    print("\n⏹️  Server gestoppt")
 
 if __name__ == "__main__":
     import sys
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
     start_server(port)
-
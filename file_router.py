@@ -9,6 +9,7 @@ Für Ihr geplantes file-basiertes Workflow-System
 import os
 import json
 import sys
+import asyncio
 from pathlib import Path
 from smart_router import SmartAIRouter
 
@@ -17,25 +18,20 @@ class FileBasedWorkflow:
         self.workspace = Path(workspace_dir).expanduser()
         self.router = SmartAIRouter()
         
-        # Ensure directories exist
+        # Ensure directories exist (nur fehlende anlegen, sonst nur ein stat pro Ordner)
         for subdir in ["features", "architecture", "documentation", "context"]:
-            (self.workspace / subdir).mkdir(parents=True, exist_ok=True)
+            path = self.workspace / subdir
+            if not path.is_dir():
+                os.makedirs(path, exist_ok=True)
     
-    def process_file_request(self, input_file: str, output_file: str, task_type: str = "auto"):
-        """
-        Verarbeitet File-basierte AI-Requests
-        
-        Args:
-            input_file: Pfad zur Input-Datei
-            output_file: Pfad zur Output-Datei  
-            task_type: "code", "architecture", "review", "auto"
-        """
+    def _prepare_request(self, input_file: str, output_file: str, task_type: str) -> dict:
+        """Liest die Input-Datei und baut Prompt + Routing-Parameter (None bei Fehler)"""
         input_path = Path(input_file)
         output_path = Path(output_file)
         
         if not input_path.exists():
             print(f"❌ Input-Datei nicht gefunden: {input_file}")
-            return False
+            return None
         
         # Read input
         with open(input_path, 'r', encoding='utf-8') as f:
@@ -50,23 +46,28 @@ class FileBasedWorkflow:
             else:
                 task_type = "code"
         
-        # Create AI prompt based on task type
-        prompt = self.create_prompt(content, task_type, input_path)
-        
-        # Force model based on task type
-        force_model = "claude" if task_type in ["architecture", "review"] else None
-        
         print(f"🔄 Verarbeite {input_path.name} -> {output_path.name}")
         print(f"📋 Task-Type: {task_type}")
         
-        # Route request
-        result = self.router.route_request(prompt, force_model)
+        return {
+            "input_path": input_path,
+            "output_path": output_path,
+            "task_type": task_type,
+            # Create AI prompt based on task type
+            "prompt": self.create_prompt(content, task_type, input_path),
+            # Force model based on task type
+            "force_model": "claude" if task_type in ["architecture", "review"] else None
+        }
+    
+    def _write_result(self, result: dict, request: dict) -> bool:
+        """Schreibt das AI-Ergebnis in die Output-Datei"""
+        output_path = request["output_path"]
         
         if result["success"]:
             # Write output
             output_path.parent.mkdir(parents=True, exist_ok=True)
             with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(self.format_output(result, task_type, input_path))
+                f.write(self.format_output(result, request["task_type"], request["input_path"]))
             
             print(f"✅ Output geschrieben: {output_path}")
             if result["cost"] > 0:
@@ -77,17 +78,81 @@ class FileBasedWorkflow:
             print(f"❌ Fehler: {result['error']}")
             return False
     
-    def create_prompt(self, content: str, task_type: str, input_path: Path) -> str:
-        """Erstellt task-spezifische Prompts"""
+    def process_file_request(self, input_file: str, output_file: str, task_type: str = "auto"):
+        """
+        Verarbeitet File-basierte AI-Requests
+        
+        Args:
+            input_file: Pfad zur Input-Datei
+            output_file: Pfad zur Output-Datei  
+            task_type: "code", "architecture", "review", "auto"
+        """
+        request = self._prepare_request(input_file, output_file, task_type)
+        if request is None:
+            return False
+        
+        # Route request
+        result = self.router.route_request(request["prompt"], request["force_model"])
+        
+        return self._write_result(result, request)
+    
+    async def process_file_request_async(self, input_file: str, output_file: str,
+                                         task_type: str = "auto") -> bool:
+        """Async-Variante von process_file_request für den Batch-Modus"""
+        request = self._prepare_request(input_file, output_file, task_type)
+        if request is None:
+            return False
+        
+        # Parallele Claude-Requests begrenzt der Router selbst
+        result = await self.router.route_request_async(request["prompt"], request["force_model"])
+        
+        return self._write_result(result, request)
+    
+    async def _process_job(self, job) -> bool:
+        """Prüft einen Manifest-Eintrag und verarbeitet ihn (Fehler bleiben pro Job)"""
+        if not isinstance(job, dict) or "input" not in job or "output" not in job:
+            raise ValueError(f"Ungültiger Manifest-Eintrag (input/output fehlt): {job!r}")
+        
+        return await self.process_file_request_async(
+            job["input"], job["output"], job.get("task_type", "auto")
+        )
+    
+    async def _process_jobs(self, jobs: list) -> list:
+        """Führt alle Jobs parallel aus (I/O-gebunden: Laufzeit ~ langsamster Job)"""
+        try:
+            return await asyncio.gather(*[self._process_job(job) for job in jobs],
+                                        return_exceptions=True)
+        finally:
+            await self.router.aclose()
+    
+    def process_manifest(self, manifest_file: str) -> bool:
+        """
+        Verarbeitet mehrere File-Requests parallel mit einer Router-Instanz
+        
+        Args:
+            manifest_file: JSON-Liste von {"input": ..., "output": ..., "task_type": ...}
+        """
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            jobs = json.load(f)
+        
+        results = asyncio.run(self._process_jobs(jobs))
+        
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                name = job.get("input", job) if isinstance(job, dict) else job
+                print(f"❌ Fehler bei {name}: {result}")
+        
+        succeeded = sum(result is True for result in results)
+        print(f"\n📊 Batch abgeschlossen: {succeeded}/{len(jobs)} erfolgreich")
+        
+        return succeeded == len(jobs)
+    
+    def create_prompt_prefix(self, task_type: str) -> str:
+        """Statischer Prompt-Anfang je Task-Type (unabhängig vom Input)"""
         
         base_context = f"""
-File: {input_path.name}
 Task: {task_type}
 Project Context: Healthcare VRP System (ASPICE-konform)
-
-Input Content:
-{content}
-
 """
         
         if task_type == "code":
@@ -131,6 +196,16 @@ Priorisiere Findings nach Kritikalität.
         else:  # generic
             return base_context + """
 Analysiere den Inhalt und gib relevante Verbesserungsvorschläge:
+"""
+    
+    def create_prompt(self, content: str, task_type: str, input_path: Path) -> str:
+        """Erstellt task-spezifische Prompts (statischer Prefix zuerst, Datei-Inhalt zuletzt)"""
+        
+        return self.create_prompt_prefix(task_type) + f"""
+File: {input_path.name}
+
+Input Content:
+{content}
 """
     
     def format_output(self, result: dict, task_type: str, input_path: Path) -> str:
@@ -155,13 +230,20 @@ Analysiere den Inhalt und gib relevante Verbesserungsvorschläge:
         return header + result['response']
 
 def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--manifest":
+        workflow = FileBasedWorkflow()
+        success = workflow.process_manifest(sys.argv[2])
+        sys.exit(0 if success else 1)
+    
     if len(sys.argv) < 4:
         print("Usage: python file_router.py <input_file> <output_file> [task_type]")
+        print("       python file_router.py --manifest <manifest.json>")
         print("Task types: code, architecture, review, auto")
         print("")
         print("Examples:")
         print("  python file_router.py features/vrp_core.py features/vrp_analysis.md code")
         print("  python file_router.py architecture/system_design.md architecture/review.md architecture")
+        print('  python file_router.py --manifest batch.json  # [{"input": ..., "output": ..., "task_type": ...}]')
         sys.exit(1)
     
     input_file = sys.argv[1]
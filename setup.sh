@@ -15,9 +15,15 @@ wget https://raw.githubusercontent.com/WietRob/ai-router-system/main/cursor_inte
 # Make executable
 chmod +x *.py
 
+# Install Python dependencies
+echo "📦 Installiere Python-Abhängigkeiten..."
+python3 -m pip install --user anthropic requests httpx orjson fastapi "uvicorn[standard]" uvloop
+
 echo ""
 echo "✅ Scripts erfolgreich heruntergeladen!"
 echo "📁 Verzeichnis: ~/ai-config/"
+echo "💡 Optional: python3 -m pip install --user numpy pyahocorasick"
+echo "   (numpy für semantic_cache, pyahocorasick für schnelleres Keyword-Matching)"
 echo ""
 echo "🔧 Nächste Schritte:"
 echo "1. Claude API Key bei console.anthropic.com holen ($5 kaufen)"
@@ -5,23 +5,205 @@ Intelligente Weiterleitung zwischen Ollama (kostenlos) und Claude API (bezahlt)
 """
 
 import os
-import json
+import re
+import asyncio
+import contextlib
+import orjson
+import copy
+import time
+import hashlib
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+import math
 import datetime
-from typing import Dict, List, Optional
-from anthropic import Anthropic
+import functools
+import types
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Dict, List, Optional, Union
 from pathlib import Path
 
+np = None  # numpy wird nur für den (optionalen) semantischen Cache importiert
+
+try:
+    import ahocorasick
+except ImportError:  # Optional, sonst vorkompilierte Regexes
+    ahocorasick = None
+
+def _compile_keywords(keywords: List[str]) -> re.Pattern:
+    """Kompiliert Keywords zu einer case-insensitiven Alternation (Substring-Match)"""
+    if not keywords:
+        return re.compile(r"(?!)")  # Matcht nie
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+def _build_keyword_automaton(ollama_keywords: List[str], escalation_keywords: List[str]):
+    """Aho-Corasick-Automat über beide Keyword-Listen (None ohne pyahocorasick)"""
+    if ahocorasick is None or not (ollama_keywords or escalation_keywords):
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for keyword in escalation_keywords:
+        automaton.add_word(keyword.lower(), "claude")
+    # Ollama-Keywords zuletzt: bei Duplikaten gewinnt Ollama (wie in der Prüfreihenfolge)
+    for keyword in ollama_keywords:
+        automaton.add_word(keyword.lower(), "ollama")
+    automaton.make_automaton()
+    return automaton
+
+def _load_numpy() -> bool:
+    """Importiert numpy bei Bedarf (False wenn nicht installiert)"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+class _SemanticCache:
+    """Embedding-Cache mit vorallokierter Matrix: eine Zeile pro Eintrag, LRU + TTL"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self.vectors = None  # (maxsize, dim), wird beim ersten Eintrag angelegt
+        self.created = np.zeros(maxsize)
+        self.last_used = np.zeros(maxsize)
+        self.results: List[Optional[Dict]] = [None] * maxsize
+    
+    def get(self, embedding, threshold: float) -> Optional[tuple[float, Dict]]:
+        """Ähnlichster gültiger Eintrag (Score, Ergebnis) oder None"""
+        if self.vectors is None:
+            return None
+        
+        now = time.time()
+        scores = self.vectors @ embedding
+        # Leere (created=0) und abgelaufene Zeilen ausblenden
+        scores[now - self.created >= self.ttl] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        
+        self.last_used[best] = now
+        return float(scores[best]), self.results[best]
+    
+    def put(self, embedding, result: Dict):
+        """Überschreibt eine leere/abgelaufene oder die am längsten ungenutzte Zeile"""
+        if self.vectors is None:
+            self.vectors = np.zeros((len(self.results), embedding.shape[0]), dtype=np.float32)
+        
+        now = time.time()
+        expired = now - self.created >= self.ttl
+        row = int(np.argmin(np.where(expired, 0.0, self.last_used)))
+        
+        self.vectors[row] = embedding
+        self.created[row] = now
+        self.last_used[row] = now
+        self.results[row] = result
+
+# Einmal aufgelöst statt pro Router-Instanz
+CONFIG_DIR = Path("~/ai-config").expanduser()
+DEFAULT_CONFIG_PATH = CONFIG_DIR / "router_config.json"
+
+def _atomic_write_json(path: Path, obj):
+    """Schreibt JSON atomar (Temp-File + os.replace, kein halb geschriebenes File)"""
+    # Eindeutiges Temp-File im Zielordner, damit parallele Writer sich nicht überschreiben
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def estimate_tokens(text: str) -> int:
+    """Grobe Token-Schätzung (~4 Zeichen pro Token)"""
+    return len(text) // 4
+
 class SmartAIRouter:
-    def __init__(self, config_path: str = "~/ai-config/router_config.json"):
+    def __init__(self, config_path: Union[str, Path] = DEFAULT_CONFIG_PATH):
         self.config_path = Path(config_path).expanduser()
         self.config = self.load_config()
-        self.budget_file = Path(config_path).parent / "budget_tracker.json"
-        self.claude_client = None
+        self.budget_file = self.config_path.parent / "budget_tracker.json"
+        # In-Memory Budget-Tracking, neu geladen wenn sich die Datei ändert (mtime)
+        self._budget_data: Optional[Dict] = None
+        self._budget_mtime: Optional[int] = None
+        
+        # Keyword-Listen einmalig vorkompilieren (ein Scan statt N Substring-Suchen)
+        self._ollama_re = _compile_keywords(self.config["ollama_keywords"])
+        self._escalate_re = _compile_keywords(self.config["escalation_keywords"])
+        self._keyword_automaton = _build_keyword_automaton(
+            self.config["ollama_keywords"], self.config["escalation_keywords"]
+        )
+        
+        # Keyword-Treffer der letzten Prompts (neueste zuerst) für Prompts mit gemeinsamem Prefix
+        self._route_history: deque = deque(maxlen=64)
+        self._max_keyword_length = max(
+            map(len, self.config["ollama_keywords"] + self.config["escalation_keywords"]), default=1
+        )
+        self._route_prefix_ratio = 0.8
+        self._route_prefix_min_length = 256
+        
+        # Exact-Match Response-Cache (LRU mit TTL), Key: SHA-256 über force_model|prompt
+        self._cache: OrderedDict[str, tuple[float, Dict]] = OrderedDict()
+        self._cache_ttl = 1800
+        self._cache_maxsize = 512
         
-        # Initialize Claude client if API key available
-        if self.config.get("claude_api_key"):
-            self.claude_client = Anthropic(api_key=self.config["claude_api_key"])
+        # Semantischer Cache: normierte Prompt-Embeddings je force_model (LRU, optional)
+        self._sem_enabled = bool(self.config.get("semantic_cache")) and _load_numpy()
+        self._sem_cache: Dict[Optional[str], _SemanticCache] = {}
+        self._sem_maxsize = 256
+        
+        # Persistente HTTP-Session für Ollama (Keep-Alive, Connection-Pooling)
+        self._http = requests.Session()
+        self._http.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+        self._http.headers["Connection"] = "keep-alive"
+        self._http.headers["Content-Type"] = "application/json"
+        
+        # Maximal parallele Claude-Requests (Budget-Schutz bei Batch/Server-Last)
+        self._claude_max_concurrency = 4
+    
+    # Async Ollama-Client erst bei Bedarf erzeugen (httpx-Import nur für Server/Batch)
+    @functools.cached_property
+    def ollama_client(self):
+        """Gemeinsamer async HTTP-Client für Ollama (Connection-Pooling)"""
+        import httpx
+        return httpx.AsyncClient(
+            base_url=self.config["ollama_base_url"],
+            headers={"Content-Type": "application/json"},
+            timeout=120
+        )
+    
+    # Claude-Clients erst beim ersten Claude-Aufruf erzeugen (anthropic-Import ist teuer)
+    @functools.cached_property
+    def claude_client(self):
+        """Claude-Client (None ohne API Key)"""
+        if not self.config.get("claude_api_key"):
+            return None
+        from anthropic import Anthropic
+        return Anthropic(api_key=self.config["claude_api_key"])
+    
+    @functools.cached_property
+    def async_claude_client(self):
+        """Async Claude-Client (None ohne API Key)"""
+        if not self.config.get("claude_api_key"):
+            return None
+        from anthropic import AsyncAnthropic
+        return AsyncAnthropic(api_key=self.config["claude_api_key"])
+    
+    @functools.cached_property
+    def _claude_slots(self) -> asyncio.Semaphore:
+        """Begrenzt parallele async Claude-Requests"""
+        return asyncio.Semaphore(self._claude_max_concurrency)
+    
+    async def aclose(self):
+        """Schließt die async HTTP-Clients"""
+        # Nur schließen, wenn der Client tatsächlich erzeugt wurde
+        if "ollama_client" in self.__dict__:
+            await self.ollama_client.aclose()
+        if self.__dict__.get("async_claude_client"):
+            await self.async_claude_client.close()
     
     def load_config(self) -> Dict:
         """Lädt Router-Konfiguration"""
@@ -39,36 +221,49 @@ class SmartAIRouter:
                 "fix", "error", "variable", "loop", "class"
             ],
             "cost_per_input_token": 0.000003,  # Claude Sonnet
-            "cost_per_output_token": 0.000015
+            "cost_per_output_token": 0.000015,
+            "semantic_cache": False,  # Benötigt numpy + Ollama-Embedding-Modell
+            "embedding_model": "nomic-embed-text",
+            "semantic_cache_threshold": 0.95
         }
         
-        if self.config_path.exists():
-            with open(self.config_path, 'r') as f:
-                config = json.load(f)
+        # Ohne Config-Datei gelten die Defaults (geschrieben wird erst bei "setup")
+        try:
+            with open(self.config_path, 'rb') as f:
+                config = orjson.loads(f.read())
                 # Merge with defaults
                 default_config.update(config)
-        else:
-            # Create config directory and file
-            self.config_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.config_path, 'w') as f:
-                json.dump(default_config, f, indent=2)
+        except FileNotFoundError:
+            pass
                 
         return default_config
     
     def save_config(self):
         """Speichert aktuelle Konfiguration"""
-        with open(self.config_path, 'w') as f:
-            json.dump(self.config, f, indent=2)
+        self.config_path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_json(self.config_path, self.config)
+    
+    def _load_budget_data(self, refresh: bool = False) -> Dict:
+        """Budget-Tracking aus dem Speicher; neu laden, wenn ein anderer Prozess die Datei geändert hat"""
+        try:
+            mtime = self.budget_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        
+        if refresh or self._budget_data is None or mtime != self._budget_mtime:
+            if mtime is None:
+                self._budget_data = {}
+            else:
+                with open(self.budget_file, 'rb') as f:
+                    self._budget_data = orjson.loads(f.read())
+            self._budget_mtime = mtime
+        
+        return self._budget_data
     
     def get_budget_status(self) -> Dict:
         """Überprüft aktuellen Budget-Status"""
         current_month = datetime.datetime.now().strftime("%Y-%m")
-        
-        if self.budget_file.exists():
-            with open(self.budget_file, 'r') as f:
-                budget_data = json.load(f)
-        else:
-            budget_data = {}
+        budget_data = self._load_budget_data()
         
         if current_month not in budget_data:
             budget_data[current_month] = {"spent": 0.0, "requests": 0}
@@ -84,6 +279,9 @@ class SmartAIRouter:
     
     def update_budget(self, cost: float):
         """Aktualisiert Budget-Tracking"""
+        # Vor dem Schreiben immer frisch von Disk lesen, damit Ausgaben anderer
+        # Prozesse (Server, CLI, file_router) nicht überschrieben werden
+        self._load_budget_data(refresh=True)
         budget_status = self.get_budget_status()
         current_month = budget_status["current_month"]
         budget_data = budget_status["budget_data"]
@@ -93,10 +291,10 @@ class SmartAIRouter:
         
         # Keep only last 3 months
         months_to_keep = sorted(budget_data.keys())[-3:]
-        budget_data = {month: budget_data[month] for month in months_to_keep}
+        self._budget_data = {month: budget_data[month] for month in months_to_keep}
         
-        with open(self.budget_file, 'w') as f:
-            json.dump(budget_data, f, indent=2)
+        _atomic_write_json(self.budget_file, self._budget_data)
+        self._budget_mtime = self.budget_file.stat().st_mtime_ns
     
     def should_escalate_to_claude(self, prompt: str) -> tuple[bool, str]:
         """Entscheidet ob Claude API nötig ist"""
@@ -109,15 +307,81 @@ class SmartAIRouter:
         if budget_status["remaining"] < 0.5:  # Weniger als 50 Cent übrig
             return False, "Budget niedrig - Ollama bevorzugt"
         
+        return self._classify_prompt(prompt)
+    
+    def _keyword_positions(self, text: str) -> tuple[Optional[int], Optional[int]]:
+        """End-Offsets des ersten Ollama- und des ersten Escalation-Keywords (None = kein Treffer)"""
+        lowered = text.lower()
+        # Aho-Corasick nur, wenn lower() die Offsets nicht verschiebt
+        if self._keyword_automaton is not None and len(lowered) == len(text):
+            # Ein linearer Durchlauf für beide Keyword-Listen
+            positions = {}
+            for end_index, category in self._keyword_automaton.iter(lowered):
+                positions.setdefault(category, end_index + 1)
+                if len(positions) == 2:
+                    break
+            return positions.get("ollama"), positions.get("claude")
+        
+        ollama_match = self._ollama_re.search(text)
+        escalate_match = self._escalate_re.search(text)
+        return (ollama_match.end() if ollama_match else None,
+                escalate_match.end() if escalate_match else None)
+    
+    def _prompt_keyword_positions(self, prompt: str) -> tuple[Optional[int], Optional[int]]:
+        """
+        Keyword-Positionen des Prompts
+        
+        Teilt ein kürzlich gerouteter Prompt >= 80% dieses Prompts als Prefix
+        (gleicher Datei-/Chat-Kontext), werden seine Treffer im gemeinsamen Prefix
+        übernommen und nur der neue Teil gescannt.
+        """
+        positions = None
+        if len(prompt) >= self._route_prefix_min_length:
+            # startswith statt LCP-Berechnung: ein memcmp pro Eintrag
+            shared = math.ceil(len(prompt) * self._route_prefix_ratio)
+            prefix = prompt[:shared]
+            for previous, (prev_ollama, prev_escalate) in self._route_history:
+                if previous.startswith(prefix):
+                    positions = self._extend_keyword_positions(
+                        prompt, shared,
+                        prev_ollama if prev_ollama is not None and prev_ollama <= shared else None,
+                        prev_escalate if prev_escalate is not None and prev_escalate <= shared else None
+                    )
+                    break
+        
+        if positions is None:
+            positions = self._keyword_positions(prompt)
+        
+        self._route_history.appendleft((prompt, positions))
+        return positions
+    
+    def _extend_keyword_positions(self, prompt: str, shared: int, ollama_end: Optional[int],
+                                  escalate_end: Optional[int]) -> tuple[Optional[int], Optional[int]]:
+        """Ergänzt die Treffer im gemeinsamen Prefix um einen Scan des neuen Prompt-Teils"""
+        if ollama_end is not None and escalate_end is not None:
+            return ollama_end, escalate_end
+        
+        # Überlappung, damit Keywords über die Prefix-Grenze hinweg gefunden werden
+        start = max(0, shared - self._max_keyword_length + 1)
+        tail_ollama, tail_escalate = self._keyword_positions(prompt[start:])
+        if ollama_end is None and tail_ollama is not None:
+            ollama_end = start + tail_ollama
+        if escalate_end is None and tail_escalate is not None:
+            escalate_end = start + tail_escalate
+        
+        return ollama_end, escalate_end
+    
+    def _classify_prompt(self, prompt: str) -> tuple[bool, str]:
+        """Keyword- und längenbasierte Routing-Entscheidung"""
         # Keyword-basierte Entscheidung
-        prompt_lower = prompt.lower()
+        ollama_end, escalate_end = self._prompt_keyword_positions(prompt)
         
         # Force Ollama für einfache Tasks
-        if any(keyword in prompt_lower for keyword in self.config["ollama_keywords"]):
+        if ollama_end is not None:
             return False, "Einfache Coding-Task - Ollama ausreichend"
         
         # Escalate zu Claude für komplexe Tasks
-        if any(keyword in prompt_lower for keyword in self.config["escalation_keywords"]):
+        if escalate_end is not None:
             return True, "Komplexe Task - Claude erforderlich"
         
         # Längen-basierte Entscheidung
@@ -127,32 +391,57 @@ class SmartAIRouter:
         # Default: Ollama (kostenlos)
         return False, "Standard-Task - Ollama Standard"
     
+    def _ollama_payload(self, prompt: str, model: str) -> Dict:
+        """Request-Body für Ollama /api/generate"""
+        return {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9
+            }
+        }
+    
+    def _ollama_result(self, result: Dict, model: str) -> Dict:
+        """Normalisiert eine Ollama-Antwort"""
+        return {
+            "success": True,
+            "response": result["response"],
+            "model": f"ollama-{model}",
+            "cost": 0.0,
+            "tokens": {"input": 0, "output": 0}  # Ollama doesn't provide token counts
+        }
+    
     def call_ollama(self, prompt: str, model: str = "mistral") -> Dict:
         """Ruft Ollama API auf"""
         try:
-            response = requests.post(
+            response = self._http.post(
                 f"{self.config['ollama_base_url']}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9
-                    }
-                },
+                data=orjson.dumps(self._ollama_payload(prompt, model)),
                 timeout=120
             )
             response.raise_for_status()
             
-            result = response.json()
+            return self._ollama_result(orjson.loads(response.content), model)
+            
+        except Exception as e:
             return {
-                "success": True,
-                "response": result["response"],
-                "model": f"ollama-{model}",
-                "cost": 0.0,
-                "tokens": {"input": 0, "output": 0}  # Ollama doesn't provide token counts
+                "success": False,
+                "error": str(e),
+                "fallback": True
             }
+    
+    async def call_ollama_async(self, prompt: str, model: str = "mistral") -> Dict:
+        """Ruft Ollama API auf (non-blocking)"""
+        try:
+            response = await self.ollama_client.post(
+                "/api/generate",
+                content=orjson.dumps(self._ollama_payload(prompt, model))
+            )
+            response.raise_for_status()
+            
+            return self._ollama_result(orjson.loads(response.content), model)
             
         except Exception as e:
             return {
@@ -161,6 +450,54 @@ class SmartAIRouter:
                 "fallback": True
             }
     
+    async def call_ollama_stream_async(self, prompt: str, model: str = "mistral") -> AsyncIterator[Dict]:
+        """Streamt die Ollama-Antwort (NDJSON) als {"response", "done"}-Chunks"""
+        payload = self._ollama_payload(prompt, model)
+        payload["stream"] = True
+        
+        async with self.ollama_client.stream(
+            "POST", "/api/generate", content=orjson.dumps(payload)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    chunk = orjson.loads(line)
+                    # Ollama meldet Fehler mitten im Stream als {"error": ...}
+                    if "error" in chunk:
+                        raise RuntimeError(f"Ollama: {chunk['error']}")
+                    done = chunk.get("done", False)
+                    yield {"response": chunk.get("response", ""), "done": done}
+                    if done:
+                        return
+        
+        # Ohne done-Zeile ist die Antwort unvollständig (nicht als Erfolg werten/cachen)
+        raise RuntimeError("Ollama-Stream ohne done beendet")
+    
+    def _claude_result(self, prompt: str, text: str, usage=None) -> Dict:
+        """Berechnet Kosten, aktualisiert Budget und normalisiert die Antwort"""
+        if usage is not None:
+            # Exakte Token-Zahlen aus der API-Antwort
+            input_tokens = usage.input_tokens
+            output_tokens = usage.output_tokens
+        else:
+            # Grobe Token-Schätzung als Fallback
+            input_tokens = estimate_tokens(prompt)
+            output_tokens = estimate_tokens(text)
+        
+        cost = (input_tokens * self.config["cost_per_input_token"] + 
+               output_tokens * self.config["cost_per_output_token"])
+        
+        # Budget aktualisieren
+        self.update_budget(cost)
+        
+        return {
+            "success": True,
+            "response": text,
+            "model": "claude-3-sonnet",
+            "cost": cost,
+            "tokens": {"input": input_tokens, "output": output_tokens}
+        }
+    
     def call_claude(self, prompt: str) -> Dict:
         """Ruft Claude API auf"""
         if not self.claude_client:
@@ -177,23 +514,33 @@ class SmartAIRouter:
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            # Grobe Token-Schätzung (Claude zählt nicht genau)
-            input_tokens = len(prompt) // 4  # Approximation
-            output_tokens = len(response.content[0].text) // 4
-            
-            cost = (input_tokens * self.config["cost_per_input_token"] + 
-                   output_tokens * self.config["cost_per_output_token"])
-            
-            # Budget aktualisieren
-            self.update_budget(cost)
+            return self._claude_result(prompt, response.content[0].text, response.usage)
             
+        except Exception as e:
             return {
-                "success": True,
-                "response": response.content[0].text,
-                "model": "claude-3-sonnet",
-                "cost": cost,
-                "tokens": {"input": input_tokens, "output": output_tokens}
+                "success": False,
+                "error": str(e),
+                "fallback": True
             }
+    
+    async def call_claude_async(self, prompt: str) -> Dict:
+        """Ruft Claude API auf (non-blocking)"""
+        if not self.async_claude_client:
+            return {
+                "success": False,
+                "error": "Claude API key nicht konfiguriert",
+                "fallback": True
+            }
+        
+        try:
+            async with self._claude_slots:
+                response = await self.async_claude_client.messages.create(
+                    model="claude-3-sonnet-20240229",
+                    max_tokens=2000,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+            
+            return self._claude_result(prompt, response.content[0].text, response.usage)
             
         except Exception as e:
             return {
@@ -202,9 +549,58 @@ class SmartAIRouter:
                 "fallback": True
             }
     
-    def route_request(self, prompt: str, force_model: Optional[str] = None) -> Dict:
-        """Haupt-Routing-Funktion"""
+    async def call_claude_stream_async(self, prompt: str) -> AsyncIterator[Dict]:
+        """
+        Streamt die Claude-Antwort als {"response", "done"}-Chunks
         
+        Der letzte Chunk enthält {"done": True, "result"}; Kosten werden
+        nach Stream-Ende anhand der Usage der finalen Message verbucht, bei
+        Abbruch (Client-Disconnect, Fehler) anhand der bisherigen Usage.
+        """
+        if not self.async_claude_client:
+            yield {"done": True, "result": {
+                "success": False,
+                "error": "Claude API key nicht konfiguriert",
+                "fallback": True
+            }}
+            return
+        
+        # Chunks sammeln und einmal joinen (kein O(n²) durch String-Konkatenation)
+        parts = []
+        result = None
+        async with self._claude_slots, self.async_claude_client.messages.stream(
+            model="claude-3-sonnet-20240229",
+            max_tokens=2000,
+            messages=[{"role": "user", "content": prompt}]
+        ) as stream:
+            try:
+                async for text in stream.text_stream:
+                    parts.append(text)
+                    yield {"response": text, "done": False}
+                final_message = await stream.get_final_message()
+                result = self._claude_result(prompt, "".join(parts), final_message.usage)
+            finally:
+                if result is None:
+                    # Abgebrochene Streams werden von Anthropic trotzdem berechnet
+                    self._claude_result(prompt, "".join(parts), self._partial_stream_usage(stream, parts))
+        
+        yield {"done": True, "result": result}
+    
+    def _partial_stream_usage(self, stream, parts: List[str]):
+        """Usage eines abgebrochenen Claude-Streams (None: Schätzung in _claude_result)"""
+        try:
+            usage = stream.current_message_snapshot.usage
+        except Exception:
+            return None  # noch kein message_start empfangen
+        
+        # output_tokens wird erst mit message_delta am Ende aktualisiert - mindestens schätzen
+        return types.SimpleNamespace(
+            input_tokens=usage.input_tokens,
+            output_tokens=max(usage.output_tokens, estimate_tokens("".join(parts)))
+        )
+    
+    def _route_decision(self, prompt: str, force_model: Optional[str]) -> tuple[bool, str]:
+        """Bestimmt Ziel-Backend (Claude oder Ollama) inkl. Begründung"""
         if force_model == "ollama":
             should_use_claude = False
             reason = "Erzwungen: Ollama"
@@ -217,21 +613,238 @@ class SmartAIRouter:
         print(f"🤖 Routing-Entscheidung: {'Claude API' if should_use_claude else 'Ollama'}")
         print(f"📝 Grund: {reason}")
         
+        return should_use_claude, reason
+    
+    def _finalize_result(self, result: Dict, reason: str) -> Dict:
+        """Ergänzt Budget-Status und Routing-Grund"""
+        result["budget_status"] = self.get_budget_status()
+        result["routing_reason"] = reason
+        
+        return result
+    
+    def _cache_key(self, prompt: str, force_model: Optional[str]) -> str:
+        """Cache-Key für Prompt + erzwungenes Modell"""
+        return hashlib.sha256(f"{force_model}|{prompt}".encode()).hexdigest()
+    
+    def _cache_hit(self, cached: Dict, reason: str) -> Dict:
+        """Kopie eines gecachten Ergebnisses (Cache-Hit kostet nichts)"""
+        result = copy.deepcopy(cached)
+        result["cost"] = 0.0
+        return self._finalize_result(result, reason)
+    
+    def _cache_get(self, key: str) -> Optional[Dict]:
+        """Liefert ein gecachtes Ergebnis oder None (abgelaufene Einträge werden entfernt)"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        
+        timestamp, cached = entry
+        if time.time() - timestamp >= self._cache_ttl:
+            del self._cache[key]
+            return None
+        
+        self._cache.move_to_end(key)
+        print("⚡ Cache-Hit - kein API-Aufruf nötig")
+        return self._cache_hit(cached, "cache-hit")
+    
+    def _normalize_embedding(self, embedding: List[float]):
+        """Normiert ein Embedding auf Länge 1 (Cosine-Similarity = Skalarprodukt)"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+    
+    def embed(self, prompt: str):
+        """Prompt-Embedding über Ollama (None bei Fehler)"""
+        try:
+            response = self._http.post(
+                f"{self.config['ollama_base_url']}/api/embeddings",
+                data=orjson.dumps({"model": self.config["embedding_model"], "prompt": prompt}),
+                timeout=30
+            )
+            response.raise_for_status()
+            return self._normalize_embedding(orjson.loads(response.content)["embedding"])
+        except Exception:
+            return None
+    
+    async def embed_async(self, prompt: str):
+        """Prompt-Embedding über Ollama (non-blocking, None bei Fehler)"""
+        try:
+            response = await self.ollama_client.post(
+                "/api/embeddings",
+                content=orjson.dumps({"model": self.config["embedding_model"], "prompt": prompt}),
+                timeout=30
+            )
+            response.raise_for_status()
+            return self._normalize_embedding(orjson.loads(response.content)["embedding"])
+        except Exception:
+            return None
+    
+    def _semantic_get(self, embedding, force_model: Optional[str]) -> Optional[Dict]:
+        """Liefert das Ergebnis des ähnlichsten gecachten Prompts (oder None)"""
+        cache = self._sem_cache.get(force_model)
+        if embedding is None or cache is None:
+            return None
+        
+        hit = cache.get(embedding, self.config["semantic_cache_threshold"])
+        if hit is None:
+            return None
+        
+        score, cached = hit
+        print(f"⚡ Semantischer Cache-Hit (Ähnlichkeit {score:.3f})")
+        return self._cache_hit(cached, "semantic-cache")
+    
+    def _cache_put(self, key: str, result: Dict, force_model: Optional[str] = None,
+                   embedding=None):
+        """Speichert ein erfolgreiches Ergebnis im Cache"""
+        if not result["success"]:
+            return
+        
+        cached = copy.deepcopy(result)
+        now = time.time()
+        self._cache[key] = (now, cached)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._cache_maxsize:
+            self._cache.popitem(last=False)
+        
+        if embedding is not None:
+            cache = self._sem_cache.get(force_model)
+            if cache is None:
+                cache = self._sem_cache[force_model] = _SemanticCache(self._sem_maxsize, self._cache_ttl)
+            cache.put(embedding, cached)
+    
+    def route_request(self, prompt: str, force_model: Optional[str] = None) -> Dict:
+        """Haupt-Routing-Funktion"""
+        key = self._cache_key(prompt, force_model)
+        cached = self._cache_get(key)
+        if cached:
+            return cached
+        
+        embedding = self.embed(prompt) if self._sem_enabled else None
+        cached = self._semantic_get(embedding, force_model)
+        if cached:
+            return cached
+        
+        should_use_claude, reason = self._route_decision(prompt, force_model)
+        
         if should_use_claude:
             result = self.call_claude(prompt)
             if not result["success"] and result.get("fallback"):
                 print("⚠️  Claude fehlgeschlagen - Fallback zu Ollama")
+                # Fallback-Antworten werden nicht gecacht
                 result = self.call_ollama(prompt)
+                return self._finalize_result(result, reason)
         else:
             result = self.call_ollama(prompt)
             if not result["success"] and result.get("fallback"):
                 print("⚠️  Ollama fehlgeschlagen - Kein Fallback verfügbar")
         
+        self._cache_put(key, result, force_model, embedding)
+        
         # Budget-Status hinzufügen
-        result["budget_status"] = self.get_budget_status()
-        result["routing_reason"] = reason
+        return self._finalize_result(result, reason)
+    
+    async def route_request_async(self, prompt: str, force_model: Optional[str] = None) -> Dict:
+        """Haupt-Routing-Funktion (non-blocking, für Cursor-Server und Batch-Modus)"""
+        key = self._cache_key(prompt, force_model)
+        cached = self._cache_get(key)
+        if cached:
+            return cached
         
-        return result
+        embedding = await self.embed_async(prompt) if self._sem_enabled else None
+        cached = self._semantic_get(embedding, force_model)
+        if cached:
+            return cached
+        
+        should_use_claude, reason = self._route_decision(prompt, force_model)
+        
+        if should_use_claude:
+            result = await self.call_claude_async(prompt)
+            if not result["success"] and result.get("fallback"):
+                print("⚠️  Claude fehlgeschlagen - Fallback zu Ollama")
+                # Fallback-Antworten werden nicht gecacht
+                result = await self.call_ollama_async(prompt)
+                return self._finalize_result(result, reason)
+        else:
+            result = await self.call_ollama_async(prompt)
+            if not result["success"] and result.get("fallback"):
+                print("⚠️  Ollama fehlgeschlagen - Kein Fallback verfügbar")
+        
+        self._cache_put(key, result, force_model, embedding)
+        
+        # Budget-Status hinzufügen
+        return self._finalize_result(result, reason)
+    
+    async def route_request_stream_async(self, prompt: str, force_model: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Streaming-Routing für den Cursor-Server
+        
+        Liefert {"done": False, "response", "model"}-Chunks und zum Schluss
+        {"done": True, "result"} mit dem vollständigen Ergebnis. Cache-Hits
+        kommen komplett im Ergebnis.
+        """
+        key = self._cache_key(prompt, force_model)
+        cached = self._cache_get(key)
+        if cached:
+            yield {"done": True, "result": cached}
+            return
+        
+        embedding = await self.embed_async(prompt) if self._sem_enabled else None
+        cached = self._semantic_get(embedding, force_model)
+        if cached:
+            yield {"done": True, "result": cached}
+            return
+        
+        should_use_claude, reason = self._route_decision(prompt, force_model)
+        cacheable = True
+        
+        if should_use_claude:
+            streamed = False
+            try:
+                # aclosing: bei Abbruch wird der Claude-Stream sofort geschlossen (und verbucht)
+                async with contextlib.aclosing(self.call_claude_stream_async(prompt)) as chunks:
+                    async for chunk in chunks:
+                        if chunk["done"]:
+                            result = chunk["result"]
+                        elif chunk["response"]:
+                            streamed = True
+                            yield {"done": False, "response": chunk["response"], "model": "claude-3-sonnet"}
+            except Exception as e:
+                # Nach bereits gesendeten Chunks ist kein Fallback mehr möglich
+                result = {
+                    "success": False,
+                    "error": str(e),
+                    "fallback": not streamed
+                }
+            
+            if result["success"] or not result.get("fallback"):
+                self._cache_put(key, result, force_model, embedding)
+                yield {"done": True, "result": self._finalize_result(result, reason)}
+                return
+            print("⚠️  Claude fehlgeschlagen - Fallback zu Ollama")
+            # Fallback-Antworten werden nicht gecacht
+            cacheable = False
+        
+        model = "mistral"
+        parts = []
+        try:
+            async with contextlib.aclosing(self.call_ollama_stream_async(prompt, model)) as chunks:
+                async for chunk in chunks:
+                    if chunk["response"]:
+                        parts.append(chunk["response"])
+                        yield {"done": False, "response": chunk["response"], "model": f"ollama-{model}"}
+            result = self._ollama_result({"response": "".join(parts)}, model)
+        except Exception as e:
+            print("⚠️  Ollama fehlgeschlagen - Kein Fallback verfügbar")
+            result = {
+                "success": False,
+                "error": str(e),
+                "fallback": True
+            }
+        
+        if cacheable:
+            self._cache_put(key, result, force_model, embedding)
+        
+        yield {"done": True, "result": self._finalize_result(result, reason)}
 
 # Convenience functions for file-based integration
 def create_router_instance():